@@ -7,29 +7,80 @@ Date: December 2025
 """
 
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import re
+import logging
+import hashlib
 from dotenv import load_dotenv
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import atexit
+import queue
+import time
+import operator
+from math import radians, sin, cos, sqrt, atan2
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# orjson is optional; fall back to Flask's built-in JSON handling without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Configure logging (level from LOG_LEVEL, default INFO)
+# Messages use lazy %-formatting so disabled levels cost almost nothing
+# An unknown LOG_LEVEL falls back to INFO rather than stopping every worker from booting
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+_log_level = getattr(logging, LOG_LEVEL, None)
+logging.basicConfig(
+    level=_log_level if isinstance(_log_level, int) else logging.INFO,
+    format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+)
+logger = logging.getLogger('gasfinder')
+if not isinstance(_log_level, int):
+    logger.warning('Unknown LOG_LEVEL %r, using INFO', LOG_LEVEL)
+
 app = Flask(__name__)
 
+
+class OrJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes responses and parses request bodies with orjson."""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+# Use orjson for jsonify() and request.json when it's installed
+if orjson is not None:
+    app.json = OrJSONProvider(app)
+
 # Enable Cross-Origin Resource Sharing (CORS) for mobile app communication
 CORS(app)
 
 # Configure rate limiting to prevent API abuse
-# Uses in-memory storage for development (consider Redis for production)
+# Set REDIS_URL in production so every worker shares one set of counters;
+# without it each process keeps its own in-memory counters (development only)
+# The moving-window strategy keeps one sorted set per client and limit in Redis,
+# holding a timestamp per request in the window (at most ~200 entries per IP)
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,  # Rate limit by IP address
-    storage_uri="memory://",
+    storage_uri=os.getenv('REDIS_URL', 'memory://'),
+    strategy='moving-window',
     default_limits=["200 per day", "50 per hour"]  # Global rate limits
 )
 
@@ -37,50 +88,508 @@ limiter = Limiter(
 GOOGLE_API_KEY = os.getenv('GOOGLE_PLACES_API_KEY')
 DATABASE = 'gas_prices.db'
 
+# Set USE_PLACES_API_NEW=1 to search with Places API (New), which returns only
+# the fields listed in PLACES_FIELD_MASK (the key must have that API enabled)
+USE_PLACES_API_NEW = os.getenv('USE_PLACES_API_NEW', '').lower() in ('1', 'true', 'yes')
+PLACES_LEGACY_URL = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
+PLACES_NEW_URL = 'https://places.googleapis.com/v1/places:searchNearby'
+PLACES_FIELD_MASK = ','.join([
+    'places.id',
+    'places.displayName',
+    'places.shortFormattedAddress',
+    'places.location',
+    'places.rating',
+    'places.currentOpeningHours.openNow',
+    'places.types',
+])
+
+# Keywords to filter out non-gas-station businesses
+# Some places (convenience stores, etc.) are tagged as gas stations but aren't primarily that
+_EXCLUDE_RE = re.compile(r'store|mart|market|shop|pharmacy|coffee|restaurant')
+_GAS_RE = re.compile(r'gas|fuel')
+
+# Google Places request timing
+PLACES_REQUEST_TIMEOUT = 15  # Seconds, applied to connect and to each read
+PLACES_RETRY_TOTAL = 2
+PLACES_RETRY_BACKOFF = 0.2
+
+# Longest a single search can take. A read timeout ends the search, so only
+# connect failures and 5xx responses lead to another attempt; the worst case is
+# every attempt waiting out both the connect and read timeouts before a 5xx,
+# plus the exponential backoff sleeps between attempts
+PLACES_MAX_SEARCH_TIME = (
+    (PLACES_RETRY_TOTAL + 1) * 2 * PLACES_REQUEST_TIMEOUT
+    + sum(PLACES_RETRY_BACKOFF * 2 ** attempt for attempt in range(PLACES_RETRY_TOTAL))
+)
+
+# Shared HTTP session so connections to Google are kept alive and reused
+# Connect failures and transient gateway errors are retried with a short backoff.
+# Read timeouts aren't retried, so they surface as requests.ReadTimeout (504)
+# after one PLACES_REQUEST_TIMEOUT rather than as a ConnectionError after several.
+# Retry-After is ignored so PLACES_MAX_SEARCH_TIME stays an upper bound
+_http = requests.Session()
+_http.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    max_retries=Retry(
+        total=PLACES_RETRY_TOTAL,
+        read=False,
+        backoff_factor=PLACES_RETRY_BACKOFF,
+        status_forcelist=[502, 503, 504],
+        respect_retry_after_header=False
+    )
+))
+
+# Client/CDN caching for /api/gas-stations responses
+# Caches may store a response but must revalidate it with the ETag before reuse,
+# so the app's refetch right after a price submission shows the new price
+STATIONS_CACHE_CONTROL = 'public, no-cache'
+
+# Google Places response cache settings
+PLACES_CACHE_TTL = 60  # Seconds a nearby search result stays fresh
+PLACES_CACHE_MAXSIZE = 4096  # Oldest entries are evicted beyond this
+
+# Fuel types accepted by both endpoints
+VALID_FUEL_TYPES = frozenset({'regular', 'midgrade', 'premium', 'diesel'})
+DEFAULT_FUEL_TYPE = 'regular'
+
+# Price submission batching (opt-in via PRICE_WRITE_BATCHING=1)
+# When enabled, submissions are queued and written in batches of up to
+# PRICE_BATCH_SIZE rows, waiting at most PRICE_BATCH_WAIT seconds per batch.
+# Leave it off where a submitted price must be readable as soon as the request returns
+PRICE_WRITE_BATCHING = os.getenv('PRICE_WRITE_BATCHING', '').lower() in ('1', 'true', 'yes')
+PRICE_BATCH_SIZE = 100
+PRICE_BATCH_WAIT = 0.1
+# Accepted batches that hit a busy/locked database are retried, backing off
+# from PRICE_RETRY_BACKOFF up to PRICE_RETRY_MAX_BACKOFF seconds between tries
+PRICE_RETRY_BACKOFF = 0.5
+PRICE_RETRY_MAX_BACKOFF = 30
+PRICE_FLUSH_ATTEMPTS = 5  # Retries allowed for the final flush at exit
+# Submissions are refused with 503 once this many rows are waiting to be written
+PRICE_QUEUE_MAXSIZE = 10000
+PRICE_WRITER_POLL = 1  # Seconds the idle writer waits before checking whether to stop
+PRICE_WRITER_JOIN_TIMEOUT = 5  # Seconds the exit flush waits for the writer to stop
+
+# How long a submitted price is shown for, in seconds
+PRICE_MAX_AGE = 24 * 60 * 60
+
+# Latest-price cache size (entries are (place_id, fuel_type) pairs)
+PRICE_CACHE_MAXSIZE = 10000
+# Seconds a cached price is trusted before the database is checked again,
+# which bounds how long another worker's newer price can take to show up
+PRICE_CACHE_TTL = 30
+
+# Search radius bounds in meters
+DEFAULT_RADIUS = 8000  # ~5 miles
+MIN_RADIUS = 100
+MAX_RADIUS = 50000
+
+# Coordinate bounds in degrees (absolute value)
+MAX_LATITUDE = 90.0
+MAX_LONGITUDE = 180.0
+
+# SQLite tuning applied to every connection
+# WAL lets reads run alongside writes; a larger page cache, mmap and
+# in-memory temp storage keep the read-heavy workload off the disk
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-64000',  # 64MB (negative values are in KiB)
+    'PRAGMA mmap_size=30000000000',
+)
+
+# Seconds init_db() waits for another worker's startup transaction (e.g. a migration)
+INIT_DB_LOCK_TIMEOUT = 60
+
+# gas_prices table definition; {table} lets migrate_gas_prices() build a copy
+GAS_PRICES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        place_id TEXT NOT NULL,
+        fuel_type TEXT NOT NULL DEFAULT 'regular',
+        timestamp INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        price REAL NOT NULL,
+        PRIMARY KEY (place_id, fuel_type, timestamp)
+    ) WITHOUT ROWID
+'''
+
+
+def apply_pragmas(conn):
+    """
+    Apply SQLITE_PRAGMAS to a freshly opened connection.
+    
+    Args:
+        conn (sqlite3.Connection): Connection to configure
+    """
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+
 
 def init_db():
     """
     Initialize SQLite database with gas_prices table.
     
-    Schema:
-    - id: Primary key
+    Schema (WITHOUT ROWID, rows stored in primary key order):
     - place_id: Google Places API unique identifier for the gas station
-    - price: Gas price per gallon (float)
     - fuel_type: Type of fuel (regular, midgrade, premium, diesel)
-    - timestamp: When the price was submitted
-    
-    Indexes:
-    - Composite index on (place_id, fuel_type, timestamp) for efficient querying
-    """
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Create gas_prices table if it doesn't exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS gas_prices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            place_id TEXT NOT NULL,
-            price REAL NOT NULL,
-            fuel_type TEXT DEFAULT 'regular',
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    - timestamp: When the price was submitted (Unix seconds, UTC)
+    - price: Gas price per gallon (float)
     
-    # Create composite index for faster queries on place_id + fuel_type + timestamp
-    # This index speeds up the get_latest_price() function significantly
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_place_fuel_timestamp 
-        ON gas_prices(place_id, fuel_type, timestamp DESC)
-    ''')
+    Primary key:
+    - (place_id, fuel_type, timestamp), which doubles as the lookup index, so
+      price queries are answered from a single b-tree with no separate index
+    
+    Databases created with the old id/DATETIME schema are migrated in place.
     
-    conn.commit()
-    conn.close()
-    print('✅ Database initialized')
+    Note:
+        Every gunicorn worker runs this at import, so the schema check and any
+        migration happen inside one BEGIN IMMEDIATE transaction: the first worker
+        migrates while the others wait for its lock, then find nothing left to do
+    """
+    # Autocommit mode so the transaction below is controlled explicitly
+    conn = sqlite3.connect(DATABASE, timeout=INIT_DB_LOCK_TIMEOUT, isolation_level=None)
+    
+    try:
+        apply_pragmas(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        
+        try:
+            # Older databases have a synthetic id column; copy them into the new layout
+            # Read under the write lock, so another worker's finished migration is seen
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(gas_prices)')]
+            if 'id' in columns:
+                migrate_gas_prices(conn)
+            
+            # Create gas_prices table if it doesn't exist
+            conn.execute(GAS_PRICES_SCHEMA.format(table='gas_prices'))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    
+    logger.info('Database initialized')
+
+
+def migrate_gas_prices(conn):
+    """
+    One-shot migration from the id/DATETIME schema to the WITHOUT ROWID schema.
+    
+    Copies every row into a new table in id order, converting timestamps to
+    Unix seconds; when two submissions share a station, fuel type and second,
+    the later one wins. NULL or unparseable timestamps become 0, so rows the
+    old schema never showed stay hidden. The old table and its indexes are
+    then dropped.
+    
+    Args:
+        conn (sqlite3.Connection): Connection with a write transaction already open;
+                                   the caller commits or rolls back
+    """
+    conn.execute('DROP TABLE IF EXISTS gas_prices_new')
+    conn.execute(GAS_PRICES_SCHEMA.format(table='gas_prices_new'))
+    conn.execute('''
+        INSERT OR REPLACE INTO gas_prices_new (place_id, fuel_type, timestamp, price)
+        SELECT place_id,
+               COALESCE(fuel_type, 'regular'),
+               COALESCE(CAST(strftime('%s', timestamp) AS INTEGER), 0),
+               price
+        FROM gas_prices
+        ORDER BY id
+    ''')
+    conn.execute('DROP TABLE gas_prices')
+    conn.execute('ALTER TABLE gas_prices_new RENAME TO gas_prices')
+    logger.info('Migrated gas_prices to WITHOUT ROWID schema')
 
 
 # Initialize database on application startup
 init_db()
 
+# Idle database connections, reused across requests
+# At most DB_POOL_SIZE are kept open; extras opened during a burst are closed on return
+DB_POOL_SIZE = 8
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+# Serializes writes so concurrent submissions don't contend for the database lock
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def _db():
+    """
+    Check out a pooled SQLite connection for the duration of a with block.
+    
+    Yields:
+        sqlite3.Connection: An idle pooled connection, or a new one if none is free
+    
+    Note:
+        The connection goes back to the pool afterwards, or is closed if the pool
+        is already full, so connections don't outlive the requests using them
+    """
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = sqlite3.connect(DATABASE, check_same_thread=False)
+        try:
+            apply_pragmas(conn)
+        except Exception:
+            conn.close()
+            raise
+    
+    try:
+        yield conn
+    finally:
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+@atexit.register
+def _close_connections():
+    """Close every idle pooled connection when the process exits."""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+# A second submission for the same station and fuel type within one second
+# replaces the first, since (place_id, fuel_type, timestamp) is the primary key
+INSERT_PRICE_SQL = '''
+    INSERT OR REPLACE INTO gas_prices (place_id, price, fuel_type)
+    VALUES (?, ?, ?)
+'''
+
+# Pending (place_id, price, fuel_type) rows when PRICE_WRITE_BATCHING is on
+_price_queue = queue.Queue(maxsize=PRICE_QUEUE_MAXSIZE)
+
+
+def _is_busy_error(e):
+    """
+    Return True if a database error means it was busy or locked and may succeed later.
+    
+    Args:
+        e (sqlite3.OperationalError): Error raised by a write
+    """
+    code = getattr(e, 'sqlite_errorcode', None)
+    if code is not None:
+        # Extended codes (e.g. SQLITE_BUSY_SNAPSHOT) keep the primary code in the low byte
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    
+    # Python < 3.11 doesn't expose the error code
+    message = str(e)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def _write_price_batch(rows):
+    """
+    Insert queued price rows with a single executemany and commit.
+    
+    Rows only enter the latest-price cache once the commit succeeds, so a
+    failed batch is never served as if it had been saved.
+    
+    Args:
+        rows (list): (place_id, price, fuel_type) tuples
+    
+    Returns:
+        bool: True if saved, False if the database was busy or locked and the
+              batch should be retried
+    
+    Raises:
+        Exception: Any other database error, which retrying won't fix
+    """
+    try:
+        with _db() as conn:
+            try:
+                with _write_lock:
+                    conn.executemany(INSERT_PRICE_SQL, rows)
+                    conn.commit()
+                    # Still under the lock, so the cache sees writes in commit order
+                    for place_id, price, fuel_type in rows:
+                        remember_price(place_id, fuel_type, price)
+            except Exception:
+                conn.rollback()
+                raise
+    except sqlite3.OperationalError as e:
+        if not _is_busy_error(e):
+            raise
+        logger.warning('Database busy saving batch of %d prices, will retry: %s', len(rows), e)
+        return False
+    
+    logger.info('Saved batch of %d prices', len(rows))
+    return True
+
+
+def _save_price_batch(rows, attempts=None, stop=None):
+    """
+    Write a batch, retrying with exponential backoff while the database is busy.
+    
+    Args:
+        rows (list): (place_id, price, fuel_type) tuples
+        attempts (int): Give up after this many tries; None retries until saved
+        stop (threading.Event): Give up once this is set, instead of backing off again
+    
+    Returns:
+        bool: True if saved, False if every allowed attempt found the database busy
+    """
+    delay = PRICE_RETRY_BACKOFF
+    tries = 0
+    while not _write_price_batch(rows):
+        tries += 1
+        if attempts is not None and tries >= attempts:
+            return False
+        if stop is not None:
+            if stop.wait(delay):
+                return False
+        else:
+            time.sleep(delay)
+        delay = min(delay * 2, PRICE_RETRY_MAX_BACKOFF)
+    return True
+
+
+# Rows the writer has taken off _price_queue but not yet saved, so the exit
+# flush can still write them; _price_writer_stop tells the writer to hand them over
+_price_batch_in_progress = []
+_price_writer_stop = threading.Event()
+
+
+def _price_writer():
+    """
+    Background thread draining _price_queue.
+    
+    Blocks for the first row, then collects more for up to PRICE_BATCH_WAIT
+    seconds (or until PRICE_BATCH_SIZE rows) before writing them together.
+    Submissions were already acknowledged with 202, so a busy database is
+    retried rather than dropping the batch, and no error stops the thread.
+    Runs until _price_writer_stop is set, leaving any unsaved batch in
+    _price_batch_in_progress.
+    """
+    rows = _price_batch_in_progress
+    while not _price_writer_stop.is_set():
+        try:
+            try:
+                rows.append(_price_queue.get(timeout=PRICE_WRITER_POLL))
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + PRICE_BATCH_WAIT
+            while len(rows) < PRICE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(_price_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if not _save_price_batch(rows, stop=_price_writer_stop):
+                return
+        except Exception:
+            logger.exception('Price writer failed; dropped batch of %d prices', len(rows))
+        rows.clear()
+
+
+def _flush_price_queue(writer):
+    """
+    Write any unsaved prices at exit (runs before connections are closed).
+    
+    Stops the writer first so its in-progress batch can be written here too.
+    
+    Args:
+        writer (threading.Thread): The running _price_writer thread
+    """
+    _price_writer_stop.set()
+    writer.join(timeout=PRICE_WRITER_JOIN_TIMEOUT)
+    
+    rows = []
+    if writer.is_alive():
+        # Still mid-write; saving its rows here could store them twice
+        if _price_batch_in_progress:
+            logger.error('Price writer did not stop; %d prices being written may be lost',
+                         len(_price_batch_in_progress))
+    else:
+        rows.extend(_price_batch_in_progress)
+    while True:
+        try:
+            rows.append(_price_queue.get_nowait())
+        except queue.Empty:
+            break
+    if not rows:
+        return
+    try:
+        saved = _save_price_batch(rows, attempts=PRICE_FLUSH_ATTEMPTS)
+    except Exception:
+        logger.exception('Failed to flush %d unsaved prices at exit', len(rows))
+        return
+    if not saved:
+        logger.error('Database busy at exit; dropped %d unsaved prices', len(rows))
+
+
+if PRICE_WRITE_BATCHING:
+    _price_writer_thread = threading.Thread(target=_price_writer, name='price-writer', daemon=True)
+    _price_writer_thread.start()
+    atexit.register(_flush_price_queue, _price_writer_thread)
+
+
+def price_cutoff():
+    """
+    Return the oldest timestamp a price can have and still be shown.
+    
+    Returns:
+        int: Unix time PRICE_MAX_AGE seconds (24 hours) ago
+    """
+    return int(time.time()) - PRICE_MAX_AGE
+
+
+# Latest submitted price per (place_id, fuel_type), kept in least-recently-used order
+# Filled by submit_price() so hot reads skip SQLite; each process only sees
+# its own submissions, so entries expire after PRICE_CACHE_TTL and reads go
+# back to the database, where prices saved by other workers are visible
+_price_cache = OrderedDict()
+_price_cache_lock = threading.Lock()
+
+
+def remember_price(place_id, fuel_type, price):
+    """
+    Record a just-submitted price in the latest-price cache.
+    
+    Args:
+        place_id (str): Google Places API identifier for the gas station
+        fuel_type (str): Type of fuel (regular, midgrade, premium, diesel)
+        price (float): Submitted price per gallon
+    """
+    timestamp = int(time.time())
+    key = (place_id, fuel_type)
+    with _price_cache_lock:
+        _price_cache[key] = (price, timestamp, time.monotonic() + PRICE_CACHE_TTL)
+        _price_cache.move_to_end(key)
+        while len(_price_cache) > PRICE_CACHE_MAXSIZE:
+            _price_cache.popitem(last=False)
+
+
+def cached_price(place_id, fuel_type, cutoff):
+    """
+    Look up a price in the latest-price cache.
+    
+    Args:
+        place_id (str): Google Places API identifier for the gas station
+        fuel_type (str): Type of fuel (regular, midgrade, premium, diesel)
+        cutoff (int): Oldest timestamp to accept, from price_cutoff()
+    
+    Returns:
+        dict: {'price': float, 'timestamp': int} or None if not cached, expired or too old
+    """
+    key = (place_id, fuel_type)
+    with _price_cache_lock:
+        entry = _price_cache.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= cutoff or entry[2] <= time.monotonic():
+            del _price_cache[key]
+            return None
+        _price_cache.move_to_end(key)
+        return {'price': entry[0], 'timestamp': entry[1]}
+
 
 def get_latest_price(place_id, fuel_type='regular'):
     """
@@ -91,35 +600,105 @@ def get_latest_price(place_id, fuel_type='regular'):
         fuel_type (str): Type of fuel (regular, midgrade, premium, diesel)
     
     Returns:
-        dict: {'price': float, 'timestamp': str} or None if no recent price exists
+        dict: {'price': float, 'timestamp': int} or None if no recent price exists
     
     Note:
         Only returns prices from the last 24 hours to ensure freshness
     """
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
     # Calculate timestamp for 24 hours ago
-    yesterday = datetime.now() - timedelta(hours=24)
+    yesterday = price_cutoff()
+    
+    # Recently submitted prices are served without touching the database
+    price_data = cached_price(place_id, fuel_type, yesterday)
+    if price_data:
+        return price_data
     
     # Query for most recent price within last 24 hours
-    # Uses the composite index for optimal performance
-    cursor.execute('''
-        SELECT price, timestamp 
-        FROM gas_prices 
-        WHERE place_id = ? AND fuel_type = ? AND timestamp > ?
-        ORDER BY timestamp DESC 
-        LIMIT 1
-    ''', (place_id, fuel_type, yesterday))
-    
-    result = cursor.fetchone()
-    conn.close()
+    # Served straight from the primary key b-tree
+    with _db() as conn:
+        result = conn.execute('''
+            SELECT price, timestamp 
+            FROM gas_prices 
+            WHERE place_id = ? AND fuel_type = ? AND timestamp > ?
+            ORDER BY timestamp DESC 
+            LIMIT 1
+        ''', (place_id, fuel_type, yesterday)).fetchone()
     
     if result:
         return {'price': result[0], 'timestamp': result[1]}
     return None
 
 
+def get_latest_prices(place_ids, fuel_type='regular', cutoff=None):
+    """
+    Retrieve the most recent price for several gas stations in a single query.
+    
+    Args:
+        place_ids (list): Google Places API identifiers for the gas stations
+        fuel_type (str): Type of fuel (regular, midgrade, premium, diesel)
+        cutoff (int): Oldest timestamp to accept; defaults to price_cutoff()
+    
+    Returns:
+        dict: {place_id: {'price': float, 'timestamp': int}} for stations with a recent price
+    
+    Note:
+        Same 24 hour freshness window as get_latest_price(); stations without
+        a recent price are simply absent from the result
+    """
+    if not place_ids:
+        return {}
+    
+    if cutoff is None:
+        cutoff = price_cutoff()
+    
+    # Recently submitted prices are served without touching the database
+    latest = {}
+    for place_id in place_ids:
+        price_data = cached_price(place_id, fuel_type, cutoff)
+        if price_data:
+            latest[place_id] = price_data
+    
+    place_ids = [place_id for place_id in place_ids if place_id not in latest]
+    if not place_ids:
+        return latest
+    
+    # One query for every station instead of one per station
+    # SQLite returns the price from the row holding MAX(timestamp) in each group
+    placeholders = ','.join('?' * len(place_ids))
+    with _db() as conn:
+        rows = conn.execute(f'''
+            SELECT place_id, price, MAX(timestamp)
+            FROM gas_prices 
+            WHERE place_id IN ({placeholders}) AND fuel_type = ? AND timestamp > ?
+            GROUP BY place_id
+        ''', (*place_ids, fuel_type, cutoff)).fetchall()
+    
+    for row in rows:
+        latest[row[0]] = {'price': row[1], 'timestamp': row[2]}
+    
+    return latest
+
+
+def search_params_error(lat, lng, radius):
+    """
+    Check that a search is within valid coordinate and radius ranges.
+    
+    Args:
+        lat (float): Latitude, -MAX_LATITUDE to MAX_LATITUDE
+        lng (float): Longitude, -MAX_LONGITUDE to MAX_LONGITUDE
+        radius (float): Search radius in meters, MIN_RADIUS to MAX_RADIUS (100m to 50km)
+    
+    Returns:
+        str: Error message for the first out-of-range value (NaN never is in range),
+             or None if the search is valid
+    """
+    if not (abs(lat) <= MAX_LATITUDE and abs(lng) <= MAX_LONGITUDE):
+        return 'Invalid coordinates'
+    if not (MIN_RADIUS <= radius <= MAX_RADIUS):
+        return 'Invalid radius'
+    return None
+
+
 @app.route('/api/gas-stations', methods=['GET'])
 @limiter.limit("30 per minute")  # Endpoint-specific rate limit
 def get_gas_stations():
@@ -140,6 +719,7 @@ def get_gas_stations():
                     'name': str,
                     'address': str,
                     'distance': str,
+                    'distanceMi': float,
                     'price': str,
                     'priceAge': str,
                     'latitude': float,
@@ -154,13 +734,16 @@ def get_gas_stations():
         400: Missing or invalid parameters
         500: Google API error or internal server error
         504: Request timeout
+    
+    Caching:
+        Responses carry a weak ETag; a matching If-None-Match returns 304 with no body
     """
     try:
         # Extract and validate query parameters
         lat = request.args.get('latitude')
         lng = request.args.get('longitude')
-        radius = request.args.get('radius', 8000)  # Default 5 miles in meters
-        fuel_type = request.args.get('fuel_type', 'regular')
+        radius = request.args.get('radius', DEFAULT_RADIUS)
+        fuel_type = request.args.get('fuel_type', DEFAULT_FUEL_TYPE)
         
         # Validate required parameters
         if not lat or not lng:
@@ -171,78 +754,71 @@ def get_gas_stations():
             lat = float(lat)
             lng = float(lng)
             radius = float(radius)
-            
-            # Validate coordinate ranges
-            if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
-                return jsonify({'error': 'Invalid coordinates'}), 400
-            
-            # Validate radius range (100m to 50km)
-            if not (100 <= radius <= 50000):
-                return jsonify({'error': 'Invalid radius'}), 400
-                
         except ValueError:
             return jsonify({'error': 'Invalid coordinate format'}), 400
         
+        # Validate coordinate and radius ranges
+        error = search_params_error(lat, lng, radius)
+        if error:
+            return jsonify({'error': error}), 400
+        
         # Validate fuel type
-        valid_fuel_types = ['regular', 'midgrade', 'premium', 'diesel']
-        if fuel_type not in valid_fuel_types:
-            fuel_type = 'regular'  # Fallback to regular if invalid
+        if fuel_type not in VALID_FUEL_TYPES:
+            fuel_type = DEFAULT_FUEL_TYPE  # Fallback to regular if invalid
         
         # Log search parameters for debugging
-        print(f'\n🔍 Searching {radius/1609.34:.1f} miles around ({lat:.4f}, {lng:.4f})')
-        print(f'⛽ Fuel type: {fuel_type}')
+        logger.info('Searching %.1f miles around (%.4f, %.4f) for %s', radius / 1609.34, lat, lng, fuel_type)
         
-        # Query Google Places API for nearby gas stations
-        url = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
-        params = {
-            'location': f'{lat},{lng}',
-            'radius': radius,
-            'type': 'gas_station',  # Filter for gas stations only
-            'key': GOOGLE_API_KEY
-        }
-        
-        # Make request with 15-second timeout
-        response = requests.get(url, params=params, timeout=15)
-        data = response.json()
+        # Nearby clients share results for a short while instead of each hitting Google
+        data, cache_status = get_places(lat, lng, radius)
         
-        print(f'✅ Google returned: {len(data.get("results", []))} results')
+        logger.info('Google returned %d results (cache %s)', len(data.get('results', [])), cache_status)
         
         # Handle Google API errors
         if data['status'] != 'OK':
-            print(f'❌ Google API error: {data["status"]}')
+            logger.error('Google API error: %s', data['status'])
             return jsonify({'error': f"Google API error: {data['status']}"}), 500
         
-        # Keywords to filter out non-gas-station businesses
-        # Some places (convenience stores, etc.) are tagged as gas stations but aren't primarily that
-        exclude_keywords = ['store', 'mart', 'market', 'shop', 'pharmacy', 'coffee', 'restaurant']
+        filtered = []
         
-        gas_stations = []
-        
-        # Process each result from Google Places API
+        # First pass: filter results from Google Places API, cheapest checks first,
+        # so dropped places never reach the distance math or the price lookup
         for place in data.get('results', []):
-            name_lower = place.get('name', '').lower()
-            
-            # Filter out businesses that aren't primarily gas stations
-            # Skip if name contains exclude keywords AND doesn't contain 'gas' or 'fuel'
-            if any(keyword in name_lower for keyword in exclude_keywords) and 'gas' not in name_lower and 'fuel' not in name_lower:
-                continue
-            
             # Double-check that 'gas_station' is in the types array
             place_types = place.get('types', [])
             if 'gas_station' not in place_types:
                 continue
             
-            # Calculate distance from user to station using Haversine formula
-            distance = calculate_distance(
-                lat, lng,
-                place['geometry']['location']['lat'],
-                place['geometry']['location']['lng']
-            )
+            name_lower = place.get('name', '').lower()
+            
+            # Filter out businesses that aren't primarily gas stations
+            # Skip if name contains exclude keywords AND doesn't contain 'gas' or 'fuel'
+            if _EXCLUDE_RE.search(name_lower) and not _GAS_RE.search(name_lower):
+                continue
             
+            filtered.append(place)
+        
+        # Second pass: batched price lookup and distances for the remaining stations only
+        # Get most recent community-submitted prices for this fuel type in one query
+        latest_prices = get_latest_prices(
+            [place.get('place_id') for place in filtered],
+            fuel_type,
+            cutoff=price_cutoff()
+        )
+        
+        # Calculate distance from user to every station using Haversine formula
+        distances = calculate_distances(lat, lng, [
+            (place['geometry']['location']['lat'], place['geometry']['location']['lng'])
+            for place in filtered
+        ])
+        
+        gas_stations = []
+        
+        # Third pass: build a station object for each remaining result
+        for place, distance in zip(filtered, distances):
             place_id = place.get('place_id')
             
-            # Get most recent community-submitted price for this fuel type
-            price_data = get_latest_price(place_id, fuel_type)
+            price_data = latest_prices.get(place_id)
             
             # Format price display
             if price_data:
@@ -258,6 +834,7 @@ def get_gas_stations():
                 'name': place.get('name', 'Unknown'),
                 'address': place.get('vicinity', 'N/A'),
                 'distance': f"{distance:.1f} mi",
+                'distanceMi': distance,
                 'price': price_display,
                 'priceAge': price_age,
                 'latitude': place['geometry']['location']['lat'],
@@ -267,18 +844,31 @@ def get_gas_stations():
             })
         
         # Sort stations by distance (closest first)
-        gas_stations.sort(key=lambda x: float(x['distance'].split()[0]))
+        gas_stations.sort(key=operator.itemgetter('distanceMi'))
+        
+        # Serialize once; the ETag covers exactly the bytes sent, so any change
+        # (price, isOpen, rating, name, ...) produces a new one. Caches only
+        # revalidate against the same URL, so the search parameters aren't needed
+        body = app.json.dumps({'stations': gas_stations})
+        etag = stations_etag(body)
         
-        print(f'✅ Returning {len(gas_stations)} gas stations for {fuel_type}\n')
-        return jsonify({'stations': gas_stations})
+        if request.if_none_match.contains_weak(etag):
+            logger.info('Stations unchanged for %s, returning 304', fuel_type)
+            result = app.response_class(status=304)
+        else:
+            logger.info('Returning %d gas stations for %s', len(gas_stations), fuel_type)
+            result = app.response_class(f'{body}\n', mimetype=app.json.mimetype)
+        
+        result.set_etag(etag, weak=True)
+        result.headers['Cache-Control'] = STATIONS_CACHE_CONTROL
+        result.headers['X-Cache'] = cache_status
+        return result
     
     except requests.Timeout:
-        print('❌ Request timeout')
+        logger.warning('Google Places request timeout')
         return jsonify({'error': 'Request timeout'}), 504
     except Exception as e:
-        print(f'❌ Error: {str(e)}')
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error in get_gas_stations: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -302,6 +892,10 @@ def submit_price():
         400: Invalid input data
         429: Rate limit exceeded (too many submissions)
         500: Database or server error
+    
+    Success Codes:
+        200: Price saved
+        202: Price queued for the next batch write (PRICE_WRITE_BATCHING enabled)
     """
     try:
         # Validate content type
@@ -313,17 +907,16 @@ def submit_price():
         # Extract parameters
         place_id = data.get('place_id')
         price = data.get('price')
-        fuel_type = data.get('fuel_type', 'regular')
+        fuel_type = data.get('fuel_type', DEFAULT_FUEL_TYPE)
         
-        print(f'\n💰 Price submission: ${price} for {fuel_type} at {place_id}')
+        logger.info('Price submission: $%s for %s at %s', price, fuel_type, place_id)
         
         # Validate required fields
         if not place_id or price is None:
             return jsonify({'error': 'Missing place_id or price'}), 400
         
         # Validate fuel type
-        valid_fuel_types = ['regular', 'midgrade', 'premium', 'diesel']
-        if fuel_type not in valid_fuel_types:
+        if fuel_type not in VALID_FUEL_TYPES:
             return jsonify({'error': 'Invalid fuel type'}), 400
         
         # Validate price
@@ -341,35 +934,280 @@ def submit_price():
         except (ValueError, TypeError):
             return jsonify({'error': 'Price must be a valid number'}), 400
         
-        # Insert price into database
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
+        # Queue for the background writer; the price is stored within PRICE_BATCH_WAIT
+        if PRICE_WRITE_BATCHING:
+            try:
+                _price_queue.put_nowait((place_id, price, fuel_type))
+            except queue.Full:
+                logger.warning('Price queue full; refusing %s submission for %s', fuel_type, place_id)
+                return jsonify({'error': 'Too many pending submissions, please try again shortly'}), 503
+            logger.info('Price queued for %s', fuel_type)
+            return jsonify({'success': True, 'message': 'Price submitted successfully'}), 202
         
-        try:
-            cursor.execute('''
-                INSERT INTO gas_prices (place_id, price, fuel_type)
-                VALUES (?, ?, ?)
-            ''', (place_id, price, fuel_type))
-            
-            conn.commit()
-            print(f'✅ Price saved successfully for {fuel_type}\n')
-            
-        except Exception as e:
-            print(f'❌ Database error: {e}\n')
-            conn.close()
-            return jsonify({'error': 'Failed to save price'}), 500
-        finally:
-            conn.close()
+        # Insert price into database
+        with _db() as conn:
+            try:
+                with _write_lock:
+                    conn.execute(INSERT_PRICE_SQL, (place_id, price, fuel_type))
+                    conn.commit()
+                    # Still under the lock, so the cache sees writes in commit order
+                    remember_price(place_id, fuel_type, price)
+                logger.info('Price saved successfully for %s', fuel_type)
+                
+            except Exception as e:
+                logger.error('Database error: %s', e)
+                conn.rollback()
+                return jsonify({'error': 'Failed to save price'}), 500
         
         return jsonify({'success': True, 'message': 'Price submitted successfully'})
     
     except Exception as e:
-        print(f'❌ Error: {str(e)}\n')
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error in submit_price: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
+# Nearby search responses keyed by rounded search location
+# Each value is (expires_at, data); insertion order doubles as age for eviction
+_places_cache = OrderedDict()
+_places_cache_lock = threading.Lock()
+
+
+def _decode_json(response):
+    """Decode a requests response body, with orjson when it's installed."""
+    return orjson.loads(response.content) if orjson is not None else response.json()
+
+
+def search_places_legacy(lat, lng, radius):
+    """
+    Search for nearby gas stations with the legacy Places Nearby Search API.
+    
+    Args:
+        lat (float): Search latitude
+        lng (float): Search longitude
+        radius (float): Search radius in meters
+    
+    Returns:
+        dict: Google's response, {'status': str, 'results': [...]}
+    """
+    params = {
+        'location': f'{lat},{lng}',
+        'radius': radius,
+        'type': 'gas_station',  # Filter for gas stations only
+        'key': GOOGLE_API_KEY
+    }
+    
+    # Make request with PLACES_REQUEST_TIMEOUT (15-second) timeout
+    response = _http.get(PLACES_LEGACY_URL, params=params, timeout=PLACES_REQUEST_TIMEOUT)
+    return _decode_json(response)
+
+
+def search_places_new(lat, lng, radius):
+    """
+    Search for nearby gas stations with Places API (New).
+    
+    Only the fields in PLACES_FIELD_MASK are requested, which keeps the
+    response much smaller than the legacy API's full place records.
+    
+    Args:
+        lat (float): Search latitude
+        lng (float): Search longitude
+        radius (float): Search radius in meters
+    
+    Returns:
+        dict: Response converted to the legacy shape, {'status': str, 'results': [...]},
+              so callers don't need to know which API was used
+    """
+    body = {
+        'includedTypes': ['gas_station'],  # Filter for gas stations only
+        'maxResultCount': 20,
+        'locationRestriction': {
+            'circle': {
+                'center': {'latitude': lat, 'longitude': lng},
+                'radius': radius
+            }
+        }
+    }
+    headers = {
+        'X-Goog-Api-Key': GOOGLE_API_KEY,
+        'X-Goog-FieldMask': PLACES_FIELD_MASK
+    }
+    
+    # Make request with PLACES_REQUEST_TIMEOUT (15-second) timeout
+    response = _http.post(PLACES_NEW_URL, json=body, headers=headers, timeout=PLACES_REQUEST_TIMEOUT)
+    data = _decode_json(response)
+    
+    # Errors come back as {'error': {'status': ..., 'message': ...}}
+    if 'error' in data:
+        return {'status': data['error'].get('status', 'UNKNOWN_ERROR'), 'results': []}
+    
+    places = data.get('places', [])
+    results = [{
+        'place_id': place.get('id'),
+        'name': place.get('displayName', {}).get('text', 'Unknown'),
+        'vicinity': place.get('shortFormattedAddress', 'N/A'),
+        'geometry': {
+            'location': {
+                'lat': place['location']['latitude'],
+                'lng': place['location']['longitude']
+            }
+        },
+        'rating': place.get('rating', 'N/A'),
+        'opening_hours': {'open_now': place.get('currentOpeningHours', {}).get('openNow')},
+        'types': place.get('types', [])
+    } for place in places]
+    
+    return {'status': 'OK' if results else 'ZERO_RESULTS', 'results': results}
+
+
+def places_cache_key(lat, lng, radius):
+    """
+    Build the Places cache key for a search.
+    
+    Args:
+        lat (float): Search latitude
+        lng (float): Search longitude
+        radius (float): Search radius in meters
+    
+    Returns:
+        tuple: Coordinates rounded to ~100m and the exact radius
+    
+    Note:
+        fuel_type is not part of the key since it only affects the price lookup,
+        not the Google Places request. The radius isn't bucketed, since a result
+        set fetched for one radius can't stand in for another.
+    """
+    return (round(lat, 3), round(lng, 3), radius)
+
+
+def get_cached_places(key):
+    """
+    Return a cached nearby search response, or None if missing or expired.
+    
+    Args:
+        key (tuple): Key from places_cache_key()
+    """
+    with _places_cache_lock:
+        entry = _places_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at <= time.monotonic():
+            del _places_cache[key]
+            return None
+        return data
+
+
+def cache_places(key, data):
+    """
+    Store a nearby search response for PLACES_CACHE_TTL seconds.
+    
+    Args:
+        key (tuple): Key from places_cache_key()
+        data (dict): Decoded Google Places response
+    """
+    with _places_cache_lock:
+        _places_cache.pop(key, None)
+        _places_cache[key] = (time.monotonic() + PLACES_CACHE_TTL, data)
+        while len(_places_cache) > PLACES_CACHE_MAXSIZE:
+            _places_cache.popitem(last=False)
+
+
+# Google Places searches currently in progress, keyed like _places_cache
+# Each value is [threading.Event, data, error]; error is set if the search raised
+# (including BaseExceptions such as GreenletExit that interrupt it)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def search_places(lat, lng, radius):
+    """Query whichever Google Places API is configured for nearby gas stations."""
+    if USE_PLACES_API_NEW:
+        return search_places_new(lat, lng, radius)
+    return search_places_legacy(lat, lng, radius)
+
+
+def get_places(lat, lng, radius):
+    """
+    Return nearby search results from the cache, a search in progress, or Google.
+    
+    Concurrent misses for the same cache key are collapsed into a single
+    upstream call: the first request searches, the rest wait for its result
+    (or its error) for up to PLACES_MAX_SEARCH_TIME and never search themselves.
+    
+    Args:
+        lat (float): Search latitude
+        lng (float): Search longitude
+        radius (float): Search radius in meters
+    
+    Returns:
+        tuple: (data, cache_status) where cache_status is 'HIT' (cached),
+               'SHARED' (waited on another request's search) or 'MISS'
+    
+    Raises:
+        requests.Timeout: The search, or the shared search being waited on, timed out
+                          or was interrupted
+        requests.ConnectionError: The shared search being waited on failed otherwise
+    """
+    key = places_cache_key(lat, lng, radius)
+    data = get_cached_places(key)
+    if data is not None:
+        return data, 'HIT'
+    
+    with _inflight_lock:
+        inflight = _inflight.get(key)
+        leader = inflight is None
+        if leader:
+            inflight = _inflight[key] = [threading.Event(), None, None]
+    
+    if not leader:
+        # Share the leader's outcome, success or failure, rather than adding
+        # more upstream calls while Google is slow
+        if not inflight[0].wait(timeout=PLACES_MAX_SEARCH_TIME):
+            raise requests.Timeout('Timed out waiting for shared Google Places search')
+        # Raise a fresh exception per follower: re-raising the leader's one
+        # instance from many threads would keep growing its shared traceback
+        error = inflight[2]
+        if isinstance(error, requests.Timeout):
+            raise requests.Timeout('Shared Google Places search timed out') from error
+        if isinstance(error, Exception):
+            raise requests.ConnectionError('Shared Google Places search failed') from error
+        if error is not None or inflight[1] is None:
+            # The leader was interrupted (e.g. GreenletExit or gevent.Timeout),
+            # which shouldn't be re-raised in this request
+            raise requests.Timeout('Shared Google Places search was interrupted')
+        return inflight[1], 'SHARED'
+    
+    try:
+        data = search_places(lat, lng, radius)
+        inflight[1] = data
+        
+        # Only successful responses are worth reusing
+        if data.get('status') == 'OK':
+            cache_places(key, data)
+    except BaseException as e:
+        inflight[2] = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        inflight[0].set()
+    
+    return data, 'MISS'
+
+
+def stations_etag(body):
+    """
+    Build an ETag value for a serialized /api/gas-stations response.
+    
+    Args:
+        body (str): JSON response body, as produced by app.json.dumps()
+    
+    Returns:
+        str: 16 hex character digest of the whole body
+    """
+    return hashlib.blake2b(body.encode(), digest_size=8).hexdigest()
+
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """
     Calculate distance between two coordinates using the Haversine formula.
@@ -387,24 +1225,42 @@ def calculate_distance(lat1, lon1, lat2, lon2):
         Haversine formula accounts for Earth's curvature and is accurate for distances up to ~500km.
         For longer distances, consider using Vincenty's formula for better accuracy.
     """
-    from math import radians, sin, cos, sqrt, atan2
+    return calculate_distances(lat1, lon1, [(lat2, lon2)])[0]
+
+
+def calculate_distances(lat, lng, points):
+    """
+    Calculate Haversine distances from one origin to many points.
+    
+    Args:
+        lat (float): Latitude of the origin
+        lng (float): Longitude of the origin
+        points (list): (latitude, longitude) tuples
+    
+    Returns:
+        list: Distance in miles to each point, in the same order
     
+    Note:
+        The origin's radians and cosine are computed once for the whole batch;
+        calculate_distance() is the single-point form of this function
+    """
     # Earth's radius in miles
     R = 3959
     
-    # Convert coordinates from degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    lat1 = radians(lat)
+    lon1 = radians(lng)
+    cos_lat1 = cos(lat1)
     
-    # Calculate differences
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    
-    # Haversine formula
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    distance = R * c
+    distances = []
+    for lat2, lon2 in points:
+        lat2 = radians(lat2)
+        dlat = lat2 - lat1
+        dlon = radians(lon2) - lon1
+        
+        a = sin(dlat/2)**2 + cos_lat1 * cos(lat2) * sin(dlon/2)**2
+        distances.append(R * 2 * atan2(sqrt(a), sqrt(1-a)))
     
-    return distance
+    return distances
 
 
 @app.route('/health', methods=['GET'])
@@ -421,5 +1277,6 @@ def health():
 # Application entry point
 if __name__ == '__main__':
     # Run Flask development server
-    # For production, use a WSGI server like Gunicorn
+    # For production, run under Gunicorn's gevent worker (see Procfile) so slow
+    # Google Places calls don't block other requests
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file